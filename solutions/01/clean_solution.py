@@ -1,72 +1,302 @@
 """
 This module contains a clean solution to both parts of the puzzle (day 1 of Advent of Code 2024).
 """
-from typing import List, Tuple
+import os
+import re
+import tempfile
+from array import array
+from collections import Counter
+from heapq import merge
+from itertools import groupby
+from operator import sub
+from typing import Iterable, Iterator, List, Sequence, Tuple
 
+RUN_SIZE = 1_000_000
+READ_BUFFER_SIZE = 4096
+# most run files opened at once by a merge, for both columns together this stays below the usual ulimit
+MAX_FAN_IN = 64
+READ_CHUNK_SIZE = 1 << 18
+# rows of two unsigned numbers, checked for a whole chunk of rows at once, other chunks are checked row by row
+ROWS_PATTERN = re.compile(rb"(?:[0-9]+[ \t]+[0-9]+\r?\n)*(?:[0-9]+[ \t]+[0-9]+)?")
 
-def read_data(path: str) -> Tuple[List[int], List[int]]:
+
+def read_data(path: str) -> Tuple[array, array]:
     """
-    Reads data from a file and returns two lists of integers.
+    Reads data from a file and returns two sorted arrays of 64-bit integers.
 
     :param path: path to the file
-    :return: two lists of integers
+    :return: two sorted int64 arrays, left and right column
+    """
+    location_ids_left = array("q")
+    location_ids_right = array("q")
+    with open(path, "rb") as f:
+        number = 0
+        rest = b""
+        while True:
+            block = f.read(READ_CHUNK_SIZE)
+            chunk = rest + block
+            # a chunk ends after its last full row, the rest is carried over to the next one
+            end = chunk.rfind(b"\n") + 1 if block else len(chunk)
+            chunk, rest = chunk[:end], chunk[end:]
+            if chunk:
+                if not ROWS_PATTERN.fullmatch(chunk):
+                    _check_rows(chunk.splitlines(), number)
+                values = chunk.split()
+                location_ids_left.extend(map(int, values[0::2]))
+                location_ids_right.extend(map(int, values[1::2]))
+                number += chunk.count(b"\n")
+            if not block:
+                break
+
+    return _sorted(location_ids_left), _sorted(location_ids_right)
+
+
+def _sorted(values: array) -> array:
+    # only one column is boxed at a time
+    values = values.tolist()
+    values.sort()
+    result = array("q")
+    result.fromlist(values)
+    return result
+
+
+def _check_rows(rows: List[bytes], number: int):
+    for row in rows:
+        number += 1
+        if len(row.split()) != 2:
+            raise ValueError(f"Row {number} does not consist of two location ids: {row.decode().strip()!r}")
+
+
+class SortedRuns:
+    """
+    One column of the input, spilled to disk as sorted runs of int64 values.
+
+    Iterating over it k-way merges the runs, so only READ_BUFFER_SIZE values per run are
+    held in memory at a time. If there are more than max_fan_in runs, they are first merged
+    into fewer, longer runs, so at most max_fan_in files are open at once. Use it as a
+    context manager to remove the run files.
+    """
+
+    def __init__(self, directory: str = None, max_fan_in: int = MAX_FAN_IN):
+        self.directory = directory
+        self.max_fan_in = max_fan_in
+        self.paths: List[str] = []
+
+    def spill(self, values: array):
+        """
+        Sorts the values and writes them to a new run file.
+
+        :param values: int64 array with the values of one run
+        """
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            array("q", sorted(values)).tofile(f)
+        self.paths.append(path)
+
+    def __iter__(self) -> Iterator[int]:
+        while len(self.paths) > self.max_fan_in:
+            self.paths = [self._merge_runs(self.paths[:self.max_fan_in])] + self.paths[self.max_fan_in:]
+        return merge(*(self._read_run(path) for path in self.paths))
+
+    def _merge_runs(self, paths: List[str]) -> str:
+        """
+        Merges runs into a new run file and removes them.
+
+        :param paths: paths of the run files
+        :return: path of the merged run file
+        """
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                buffer = array("q")
+                for value in merge(*(self._read_run(run) for run in paths)):
+                    buffer.append(value)
+                    if len(buffer) == READ_BUFFER_SIZE:
+                        buffer.tofile(f)
+                        buffer = array("q")
+                buffer.tofile(f)
+        except BaseException:
+            os.remove(path)
+            raise
+        for run in paths:
+            os.remove(run)
+        return path
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[int]:
+        with open(path, "rb") as f:
+            while True:
+                buffer = array("q")
+                try:
+                    buffer.fromfile(f, READ_BUFFER_SIZE)
+                except EOFError:
+                    yield from buffer
+                    return
+                yield from buffer
+
+    def close(self):
+        for path in self.paths:
+            os.remove(path)
+        self.paths = []
+
+    def __enter__(self) -> "SortedRuns":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_data_external(path: str, run_size: int = RUN_SIZE, directory: str = None) -> Tuple[SortedRuns, SortedRuns]:
     """
-    with open(path, "r") as f:
-        data = f.readlines()
+    Reads data from a file in a streaming fashion and spills both columns as sorted runs.
 
-    location_ids_left = []
-    location_ids_right = []
+    At most run_size rows are held in memory, use this instead of read_data for inputs
+    that do not fit into memory.
 
-    for row in data:
-        left, right = row.split()
-        location_ids_left.append(int(left))
-        location_ids_right.append(int(right))
+    :param path: path to the file
+    :param run_size: number of rows per sorted run
+    :param directory: directory for the run files, defaults to the system temp directory
+    :return: sorted runs of the left and the right column
+    """
+    location_ids_left = SortedRuns(directory)
+    location_ids_right = SortedRuns(directory)
+    left_buffer = array("q")
+    right_buffer = array("q")
+
+    try:
+        with open(path, "rb") as f:
+            for row in f:
+                left, right = row.split()
+                left_buffer.append(int(left))
+                right_buffer.append(int(right))
+                if len(left_buffer) == run_size:
+                    location_ids_left.spill(left_buffer)
+                    location_ids_right.spill(right_buffer)
+                    left_buffer = array("q")
+                    right_buffer = array("q")
 
-    location_ids_left.sort()
-    location_ids_right.sort()
+        if left_buffer:
+            location_ids_left.spill(left_buffer)
+            location_ids_right.spill(right_buffer)
+    except BaseException:
+        # the caller never gets the runs, so remove the files spilled so far
+        location_ids_left.close()
+        location_ids_right.close()
+        raise
     return location_ids_left, location_ids_right
 
 
-def sum_of_differences(location_ids_left: List[int], location_ids_right: List[int]) -> int:
+def sum_of_differences(location_ids_left: Iterable[int], location_ids_right: Iterable[int]) -> int:
     """
     Calculate the sum of differences, solves part 1 of the puzzle.
 
-    :param location_ids_left: list of integers, left in the input data
-    :param location_ids_right: list of integers, right in the input data
+    Works on any sorted iterables, including the SortedRuns from read_data_external.
+
+    :param location_ids_left: sorted integers, left in the input data
+    :param location_ids_right: sorted integers, right in the input data
     :return: sum of differences
     """
-    sum_of_differences = 0
-    for left, right in zip(location_ids_left, location_ids_right):
-        sum_of_differences += abs(left - right)
-    return sum_of_differences
+    return sum(map(abs, map(sub, location_ids_left, location_ids_right)))
 
 
-def count_number_in_list(number: int, lst: List[int]) -> int:
+class SimilarityIndex:
     """
-    Counts the number of occurrences of a number in a list.
+    Frequency index over both location id lists, keeps the similarity score up to date.
 
-    :param number: number to count
-    :param lst: list of integers
-    :return: number of occurrences
+    The score is the sum of x * left_count[x] * right_count[x] over all ids, so appending
+    a row to either side only changes the term of that id.
     """
-    return sum(1 for x in lst if x == number)
 
+    def __init__(self, location_ids_left: Sequence[int], location_ids_right: Sequence[int]):
+        self.left_counts = Counter(location_ids_left)
+        self.right_counts = Counter(location_ids_right)
+        self.score = sum(x * count * self.right_counts[x] for x, count in self.left_counts.items())
+
+    def add_left(self, location_id: int) -> int:
+        """
+        Adds a location id to the left list and returns the updated similarity score.
+
+        :param location_id: location id to add
+        :return: similarity score
+        """
+        self.left_counts[location_id] += 1
+        self.score += location_id * self.right_counts[location_id]
+        return self.score
 
-def calculate_similarity_score(location_ids_left: List[int], location_ids_right: List[int]) -> int:
+    def add_right(self, location_id: int) -> int:
+        """
+        Adds a location id to the right list and returns the updated similarity score.
+
+        :param location_id: location id to add
+        :return: similarity score
+        """
+        self.right_counts[location_id] += 1
+        self.score += location_id * self.left_counts[location_id]
+        return self.score
+
+    def add_row(self, left: int, right: int) -> int:
+        """
+        Adds a row of the input data and returns the updated similarity score.
+
+        :param left: location id in the left column
+        :param right: location id in the right column
+        :return: similarity score
+        """
+        self.add_left(left)
+        return self.add_right(right)
+
+
+def calculate_similarity_score(location_ids_left: Sequence[int], location_ids_right: Sequence[int]) -> int:
     """
     Calculate the similarity score, solves part 2 of the puzzle.
 
-    :param location_ids_left: list of integers, left in the input data
-    :param location_ids_right: list of integers, right in the input data
+    The occurrences of every id are counted once in a SimilarityIndex.
+
+    :param location_ids_left: integers, left in the input data
+    :param location_ids_right: integers, right in the input data
+    :return: similarity score
+    """
+    return SimilarityIndex(location_ids_left, location_ids_right).score
+
+
+def calculate_similarity_score_streaming(location_ids_left: Iterable[int], location_ids_right: Iterable[int]) -> int:
+    """
+    Calculate the similarity score with a merge join over two sorted streams.
+
+    :param location_ids_left: sorted integers, left in the input data
+    :param location_ids_right: sorted integers, right in the input data
     :return: similarity score
     """
     similarity_score = 0
-    for x in location_ids_left:
-        count = count_number_in_list(x, location_ids_right)
-        similarity_score += x * count
+    right_groups = groupby(location_ids_right)
+    right, right_group = next(right_groups, (None, None))
+    for left, left_group in groupby(location_ids_left):
+        while right is not None and right < left:
+            right, right_group = next(right_groups, (None, None))
+        if right is None:
+            break
+        if right == left:
+            similarity_score += left * sum(1 for _ in left_group) * sum(1 for _ in right_group)
     return similarity_score
 
 
+def solve_external(path: str, run_size: int = RUN_SIZE, directory: str = None) -> Tuple[int, int]:
+    """
+    Solves both parts of the puzzle with peak memory bounded by run_size.
+
+    :param path: path to the file
+    :param run_size: number of rows per sorted run
+    :param directory: directory for the run files, defaults to the system temp directory
+    :return: solutions to part 1 and part 2
+    """
+    location_ids_left, location_ids_right = read_data_external(path, run_size, directory)
+    with location_ids_left, location_ids_right:
+        return (
+            sum_of_differences(location_ids_left, location_ids_right),
+            calculate_similarity_score_streaming(location_ids_left, location_ids_right),
+        )
+
+
 if __name__ == "__main__":
     location_ids_left, location_ids_right = read_data("input.txt")
     print(sum_of_differences(location_ids_left, location_ids_right))
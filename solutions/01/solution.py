@@ -1,3 +1,5 @@
+from collections import Counter
+
 with open("input.txt") as f:
     data = f.readlines()
 
@@ -18,6 +20,7 @@ s = sum(abs(x - y) for x, y in zip(l1, l2))
 print(s)
 
 s = 0
-s = sum(x * sum(1 for y in l2 if x == y) for x in l1)
+c = Counter(l2)
+s = sum(x * c[x] for x in l1)
 
 print(s)
@@ -1,7 +1,12 @@
 """
 This is a clean solution to the second day of Advent of Code 2024
 """
-from typing import List, Tuple
+import os
+from array import array
+from itertools import accumulate, chain, compress, islice, repeat
+from multiprocessing import Pool
+from operator import mul, not_, sub
+from typing import Iterator, List, Tuple
 from enum import Enum
 
 
@@ -12,6 +17,13 @@ class Direction(Enum):
 
 LOWER_BOUND = 1
 UPPER_BOUND = 3
+MAX_REMOVALS = 1
+CHUNK_SIZE = 1 << 22
+# codes of the differences between neighbouring levels in safe_row_mask
+UNSAFE = 0
+INCREASING = 1
+DECREASING = 2
+ROW_END = 3
 
 
 def read_data(path: str) -> List[List[int]]:
@@ -29,6 +41,46 @@ def read_data(path: str) -> List[List[int]]:
     return data
 
 
+def iter_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, int]]:
+    """
+    Splits a file into byte ranges of roughly chunk_size, aligned to line boundaries.
+
+    :param path: path to the file
+    :param chunk_size: minimum number of bytes per chunk
+    :return: iterator of (start, end) byte offsets
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            f.seek(start + chunk_size - 1)
+            f.readline()
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
+
+
+def iter_rows(path: str, start: int = 0, end: int = None) -> Iterator[List[int]]:
+    """
+    Lazily reads the rows starting within a byte range of a file, skipping empty lines.
+
+    :param path: path to the file
+    :param start: byte offset of the first row, has to be at a line boundary
+    :param end: byte offset to stop at, defaults to the end of the file
+    :return: iterator of lists of integers
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            row = [int(x) for x in line.split()]
+            if row:
+                yield row
+
+
 def get_direction(x: int, y: int) -> Direction:
     """
     Returns the direction of the change from x to y.
@@ -79,6 +131,60 @@ def is_safe_row(row: List[int], lower_bound: int, upper_bound: int) -> bool:
     return True
 
 
+def to_reports(data: List[List[int]]) -> Tuple[array, array]:
+    """
+    Packs the rows into a ragged layout: one flat array of values and the row offsets into it.
+
+    Row i is values[offsets[i]:offsets[i + 1]].
+
+    :param data: list of lists of integers
+    :return: values and offsets, int64 arrays
+    """
+    values = array("q")
+    values.fromlist(list(chain.from_iterable(data)))
+    offsets = array("q", accumulate(map(len, data), initial=0))
+    return values, offsets
+
+
+def safe_row_mask(values: array, offsets: array, lower_bound: int, upper_bound: int) -> bytearray:
+    """
+    Returns a mask with 1 for every safe row of the ragged reports and 0 otherwise.
+
+    The differences of all neighbouring levels are coded as increasing, decreasing or unsafe in
+    one pass over the flat values, and the difference across each row boundary as ROW_END.
+    A row is then safe if its codes are all increasing or all decreasing, which is checked for
+    all rows at once on the pieces between the row ends.
+
+    :param values: flat int64 array with the levels of all rows
+    :param offsets: int64 array with the start of every row, plus the total length
+    :param lower_bound: lower bound for minimum difference
+    :param upper_bound: upper bound for maximum difference
+    :return: bytearray with one entry per row
+    """
+    codes_by_difference = {}
+    for difference in range(lower_bound, upper_bound + 1):
+        codes_by_difference[difference] = INCREASING
+        codes_by_difference[-difference] = DECREASING
+    differences = map(sub, islice(values, 1, None), values)
+    codes = bytearray(map(codes_by_difference.get, differences, repeat(UNSAFE)))
+
+    lengths = list(map(sub, islice(offsets, 1, None), offsets))
+    ends = list(compress(islice(offsets, 1, None), lengths))
+    for end in ends[:-1]:
+        codes[end - 1] = ROW_END
+    pieces = codes.split(bytes([ROW_END]))
+    not_increasing = map(len, map(bytearray.strip, pieces, repeat(bytes([INCREASING]))))
+    not_decreasing = map(len, map(bytearray.strip, pieces, repeat(bytes([DECREASING]))))
+    safe = map(not_, map(mul, not_increasing, not_decreasing))
+    if len(ends) == len(lengths):
+        return bytearray(safe)
+    # empty rows have no piece and are safe
+    mask = bytearray(map(not_, lengths))
+    for i, row_safe in zip(compress(range(len(lengths)), lengths), safe):
+        mask[i] = row_safe
+    return mask
+
+
 def solve_part1(data: List[List[int]]) -> int:
     """
     Solves part 1 of the puzzle.
@@ -86,22 +192,65 @@ def solve_part1(data: List[List[int]]) -> int:
     :param data: list of lists of integers
     :return: solution to part 1, int
     """
-    safe_rows = 0
-    for row in data:
-        if is_safe_row(row, LOWER_BOUND, UPPER_BOUND):
-            safe_rows += 1
-    return safe_rows
+    values, offsets = to_reports(data)
+    return sum(safe_row_mask(values, offsets, LOWER_BOUND, UPPER_BOUND))
 
 
-def remove_element(lst: List[int], index: int) -> List[int]:
+def is_safe_row_with_removals(row: List[int], lower_bound: int, upper_bound: int, max_removals: int) -> bool:
     """
-    Removes an element from a list at a given index.
+    Returns True if the row is safe after removing at most max_removals levels.
 
-    :param lst: list of integers
-    :param index: index of the element to remove
-    :return: list of integers
+    A single removal is checked in linear time: in a safe row with one level removed, the
+    first unsafe pair has to lose one of its two levels. For more removals, for every index
+    and direction this tracks the fewest removals for which the level at that index is the
+    last one kept, looking back at most max_removals + 1 levels. This takes
+    O(len(row) * max_removals) time and never copies the row.
+
+    :param row: list of integers
+    :param lower_bound: lower bound for minimum difference
+    :param upper_bound: upper bound for maximum difference
+    :param max_removals: maximum number of levels that can be removed
+    :return: bool
     """
-    return lst[:index] + lst[index + 1 :]
+    length = len(row)
+    if length <= max_removals + 1:
+        return True
+    if max_removals == 1:
+        return any(_is_safe_with_one_removal(row, sign, lower_bound, upper_bound) for sign in (1, -1))
+    removals = [0] * length
+    for sign in (1, -1):
+        for i in range(length):
+            fewest = i if i <= max_removals else max_removals + 1
+            level = row[i]
+            for j in range(max(0, i - max_removals - 1), i):
+                skipped = removals[j] + i - j - 1
+                if skipped < fewest and lower_bound <= sign * (level - row[j]) <= upper_bound:
+                    fewest = skipped
+            removals[i] = fewest
+            if fewest + length - 1 - i <= max_removals:
+                return True
+    return False
+
+
+def _is_safe_with_one_removal(row: List[int], sign: int, lower_bound: int, upper_bound: int) -> bool:
+    # sign is 1 for increasing and -1 for decreasing rows
+    for i in range(1, len(row)):
+        if not lower_bound <= sign * (row[i] - row[i - 1]) <= upper_bound:
+            return _is_safe_skipping(row, i - 1, sign, lower_bound, upper_bound) or _is_safe_skipping(
+                row, i, sign, lower_bound, upper_bound
+            )
+    return True
+
+
+def _is_safe_skipping(row: List[int], skipped: int, sign: int, lower_bound: int, upper_bound: int) -> bool:
+    previous = None
+    for i, level in enumerate(row):
+        if i == skipped:
+            continue
+        if previous is not None and not lower_bound <= sign * (level - previous) <= upper_bound:
+            return False
+        previous = level
+    return True
 
 
 def solve_part2(data: List[List[int]]) -> int:
@@ -111,17 +260,49 @@ def solve_part2(data: List[List[int]]) -> int:
     :param data: list of lists of integers
     :return: solution to part 2, int
     """
+    return count_safe_rows(data)[1]
+
+
+def count_safe_rows(data: List[List[int]]) -> Tuple[int, int]:
+    """
+    Counts the safe rows with and without the Problem Dampener in one go.
+
+    :param data: list of lists of integers
+    :return: solutions to part 1 and part 2
+    """
+    values, offsets = to_reports(data)
+    mask = safe_row_mask(values, offsets, LOWER_BOUND, UPPER_BOUND)
+    dampened_rows = 0
+    for row, safe in zip(data, mask):
+        if safe or is_safe_row_with_removals(row, LOWER_BOUND, UPPER_BOUND, MAX_REMOVALS):
+            dampened_rows += 1
+    return sum(mask), dampened_rows
+
+
+def _solve_shard(shard: Tuple[str, int, int]) -> Tuple[int, int]:
+    path, start, end = shard
+    return count_safe_rows(list(iter_rows(path, start, end)))
+
+
+def solve_streaming(path: str, chunk_size: int = CHUNK_SIZE, processes: int = None) -> Tuple[int, int]:
+    """
+    Solves both parts of the puzzle in one pass, fanning chunks of the file out to a process pool.
+
+    Every worker only holds the rows of a single chunk, so memory use does not grow with the file.
+
+    :param path: path to the file
+    :param chunk_size: number of bytes per shard
+    :param processes: number of worker processes, defaults to the number of cpus
+    :return: solutions to part 1 and part 2
+    """
+    shards = ((path, start, end) for start, end in iter_chunks(path, chunk_size))
     safe_rows = 0
-    for row in data:
-        if is_safe_row(row):
-            safe_rows += 1
-        else:
-            for i in range(len(row)):
-                new_row = remove_element(row, i)
-                if is_safe_row(new_row):
-                    safe_rows += 1
-                    break
-    return safe_rows
+    dampened_rows = 0
+    with Pool(processes) as pool:
+        for safe, dampened in pool.imap_unordered(_solve_shard, shards):
+            safe_rows += safe
+            dampened_rows += dampened
+    return safe_rows, dampened_rows
 
 
 if __name__ == "__main__":
@@ -1,68 +1,315 @@
-from typing import List, Tuple
+from typing import AnyStr, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Tuple
+from operator import mul
+from multiprocessing import Pool
+import mmap
+import os
 import re
 
-def read_data(path: str) -> List[List[int]]:
+CHUNK_SIZE = 1 << 20
+NUMBER = r"[0-9]+"
+
+class ChunkSummary(NamedTuple):
+    """
+    Results of a chunk of the input, for both states the chunk can be entered in.
+    """
+    result: int
+    result_if_enabled: int
+    result_if_disabled: int
+    exit_state: Optional[bool]
+
+# do()/don't() states, index into ProgramState.totals
+UNKNOWN = 0
+ENABLED = 1
+DISABLED = 2
+
+class ProgramState:
+    """
+    Running results of the instructions executed so far.
+
+    The do()/don't() state before the first instruction is unknown, so the products are summed
+    per state they were executed in, which gives the result of part 2 both for starting enabled
+    and for starting disabled.
+    """
+    def __init__(self):
+        self.totals = [0, 0, 0]
+        self.mode = UNKNOWN
+
+    @property
+    def result(self) -> int:
+        return sum(self.totals)
+
+    @property
+    def result_if_enabled(self) -> int:
+        return self.totals[UNKNOWN] + self.totals[ENABLED]
+
+    @property
+    def result_if_disabled(self) -> int:
+        return self.totals[ENABLED]
+
+    @property
+    def multiply(self) -> Optional[bool]:
+        return None if self.mode == UNKNOWN else self.mode == ENABLED
+
+    def summary(self) -> ChunkSummary:
+        return ChunkSummary(self.result, self.result_if_enabled, self.result_if_disabled, self.multiply)
+
+def execute_mul(state: ProgramState, xs: Iterable[int], ys: Iterable[int]):
+    state.totals[state.mode] += sum(map(mul, xs, ys))
+
+def execute_do(state: ProgramState):
+    state.mode = ENABLED
+
+def execute_dont(state: ProgramState):
+    state.mode = DISABLED
+
+class Opcode(NamedTuple):
+    arity: int
+    execute: Callable[..., None]
+
+# new instructions only need an entry here, the patterns below are built from this table.
+# instructions without arguments change the state and are executed one by one, instructions with
+# arguments get one iterable of ints per argument, for all of them between two state changes
+OPCODES: Dict[str, Opcode] = {
+    "mul": Opcode(2, execute_mul),
+    "do": Opcode(0, execute_do),
+    "don't": Opcode(0, execute_dont),
+}
+
+class Token(NamedTuple):
+    opcode: str
+    arguments: Tuple[int, ...]
+    end: int
+
+def _instruction_elements(name: str, arity: int) -> List[str]:
+    """
+    Split the pattern of an instruction name(x,y,...) into the regex atoms it consists of.
+    """
+    elements = [re.escape(char) for char in name] + [r"\("]
+    for i in range(arity):
+        if i > 0:
+            elements.append(",")
+        elements.append(NUMBER)
+    return elements + [r"\)"]
+
+class Handler(NamedTuple):
+    opcode: str
+    execute: Callable[..., None]
+    arguments: Tuple[int, ...]
+
+class Patterns(NamedTuple):
     """
-    Reads data from a file and returns a list of lists of integers.
+    Regex sources built from an opcode table.
+
+    :param instruction: pattern matching any instruction
+    :param handlers: handlers indexed by the last group of an instruction match
+    :param state_change: pattern matching the instructions without arguments
+    :param state_handlers: handlers indexed by the last group of a state_change match
+    :param with_arguments: pattern and handler of every instruction with arguments
+    :param split: pattern matching a character that cannot occur within an instruction
+    """
+    instruction: str
+    handlers: List[Optional[Handler]]
+    state_change: str
+    state_handlers: List[Optional[Handler]]
+    with_arguments: List[Tuple[str, Handler]]
+    split: str
+
+def compile_patterns(opcodes: Dict[str, Opcode]) -> Patterns:
+    """
+    Build the regex sources for the given opcodes.
+
+    Every argument is a group, an instruction without arguments gets an empty group at its end,
+    so the last group of a match tells which instruction it is.
+
+    :param opcodes: mapping of instruction names to opcodes
+    :return: patterns and handlers
+    """
+    alternatives = []
+    handlers: List[Optional[Handler]] = [None]
+    state_alternatives = []
+    state_handlers: List[Optional[Handler]] = [None]
+    with_arguments = []
+    inner_chars = set("0123456789")
+    for name, opcode in opcodes.items():
+        elements = _instruction_elements(name, opcode.arity)
+        alternative = "".join(f"({element})" if element == NUMBER else element for element in elements)
+        if opcode.arity == 0:
+            alternative += "()"
+            state_alternatives.append(alternative)
+            state_handlers.append(Handler(name, opcode.execute, ()))
+        else:
+            with_arguments.append((alternative, Handler(name, opcode.execute, tuple(range(1, opcode.arity + 1)))))
+            handlers.extend([None] * (opcode.arity - 1))
+        handlers.append(Handler(name, opcode.execute, tuple(range(len(handlers) - opcode.arity + 1, len(handlers) + 1))))
+        alternatives.append(alternative)
+        inner_chars.update(name[1:] + "(),")
+    split = "[^" + "".join(re.escape(char) for char in sorted(inner_chars)) + "]"
+    # a pattern that never matches if there are no instructions without arguments
+    state_change = "|".join(state_alternatives) or "(?!)"
+    return Patterns("|".join(alternatives), handlers, state_change, state_handlers, with_arguments, split)
+
+def _compile(source: str) -> Dict[type, Pattern]:
+    return {str: re.compile(source), bytes: re.compile(source.encode())}
+
+PATTERNS = compile_patterns(OPCODES)
+INSTRUCTION_PATTERNS = _compile(PATTERNS.instruction)
+STATE_CHANGE_PATTERNS = _compile(PATTERNS.state_change)
+ARGUMENT_PATTERNS = [(_compile(source), handler) for source, handler in PATTERNS.with_arguments]
+# no instruction continues across a character matching this, so the input can be split before one
+SPLIT_PATTERN = re.compile(PATTERNS.split.encode())
+# matches up to and including the last such character
+LAST_SPLIT_PATTERN = re.compile(b"(?s:.*)" + PATTERNS.split.encode())
+
+def read_data(path: str) -> str:
+    """
+    Reads data from a file and returns it as a string.
 
     :param path: path to the file
-    :return: list of lists of integers
+    :return: content of the file
     """
     with open(path, "r") as f:
         raw_data = f.read()
     return raw_data
 
-def find_regex(string:str) -> List[str]:
+def tokenize(data: AnyStr) -> Iterator[Token]:
+    """
+    Lazily find all instructions in a string or bytes object.
+
+    :param data: string to search
+    :return: iterator of tokens
+    """
+    for match in INSTRUCTION_PATTERNS[type(data)].finditer(data):
+        handler = PATTERNS.handlers[match.lastindex]
+        yield Token(handler.opcode, tuple(int(match[group]) for group in handler.arguments), match.end())
+
+def execute(state: ProgramState, data: AnyStr):
     """
-    Find all occurrences of the pattern mul(x,y) in a string.
+    Execute the instructions in a string or bytes object on the state.
 
-    :param string: string to search
-    :return: list of occurrences
+    Only the instructions without arguments are visited one by one, their handler is looked up by
+    the last group of the match. The instructions with arguments in between are found per opcode
+    and executed at once, without building tokens.
     """
-    return re.findall(r"mul\([0-9]+,[0-9]+\)", string)
+    start = 0
+    state_handlers = PATTERNS.state_handlers
+    for match in STATE_CHANGE_PATTERNS[type(data)].finditer(data):
+        _execute_with_arguments(state, data, start, match.start())
+        state_handlers[match.lastindex].execute(state)
+        start = match.end()
+    _execute_with_arguments(state, data, start, len(data))
+
+def _execute_with_arguments(state: ProgramState, data: AnyStr, start: int, end: int):
+    for patterns, handler in ARGUMENT_PATTERNS:
+        matches = patterns[type(data)].findall(data, start, end)
+        if not matches:
+            continue
+        # findall returns the argument itself instead of a tuple if there is only one
+        columns = zip(*matches) if len(handler.arguments) > 1 else [matches]
+        handler.execute(state, *(map(int, column) for column in columns))
 
-def parse_mult(string:str) -> Tuple[int]:
+def calculate_results(data: AnyStr) -> Tuple[int, int]:
     """
-    Parse the string mul(x,y) and return the two integers x,y.
+    Calculate the results of both parts in a single traversal of the data.
     """
-    string = string.strip("mul(")
-    string = string.strip(")")
-    return tuple(map(int, string.split(",")))
+    state = ProgramState()
+    execute(state, data)
+    return state.result, state.result_if_enabled
 
 def calculate_result(data:str) -> int:
     """
     Calculate the result of the multiplication of all occurrences of mul(x,y) in the data.
     """
-    result = 0
-    for match in find_regex(data):
-        x, y = parse_mult(match)
-        result += x * y
-    return result
+    return calculate_results(data)[0]
 
-def find_regex_part2(string:str) -> List[str]:
+def calculate_result_part2(data:str) -> int:
+    """
+    Calculate the result of the multiplication of all occurrences of mul(x,y) in the data.
     """
-    Find all occurrences of the pattern do(), don't() or mul(x,y) in a string.
+    return calculate_results(data)[1]
 
-    :param string: string to search
-    :return: list of occurrences
+def calculate_results_streaming(path: str, chunk_size: int = CHUNK_SIZE) -> Tuple[int, int]:
     """
-    return re.findall(r"do\(\)|mul\([0-9]+,[0-9]+\)|don't\(\)", string)
+    Calculate the results of both parts while reading the file in chunks of chunk_size bytes.
 
-def calculate_result_part2(data:str) -> int:
+    The do()/don't() state and any instruction cut off at the end of a chunk are carried over
+    to the next chunk, so memory use does not depend on the size of the file.
+
+    :param path: path to the file
+    :param chunk_size: number of bytes to read at once
+    :return: results of part 1 and part 2
     """
-    Calculate the result of the multiplication of all occurrences of mul(x,y) in the data.
+    state = ProgramState()
+    carry = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer = carry + chunk
+            if not chunk:
+                execute(state, buffer)
+                return state.result, state.result_if_enabled
+            # everything before the last character that no instruction contains can be executed
+            split = LAST_SPLIT_PATTERN.match(buffer)
+            end = split.end() - 1 if split else 0
+            execute(state, buffer[:end])
+            carry = buffer[end:]
+
+def summarize_chunk(data: bytes) -> ChunkSummary:
+    """
+    Summarize a chunk of the input independently of the do()/don't() state before it.
+
+    The exit state is None if the chunk contains neither do() nor don't().
+    """
+    state = ProgramState()
+    execute(state, data)
+    return state.summary()
+
+def split_input(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, int]]:
+    """
+    Split a file into byte ranges of roughly chunk_size that no instruction crosses.
+
+    :param path: path to the file
+    :param chunk_size: minimum number of bytes per range
+    :return: iterator of (start, end) byte offsets
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            split = SPLIT_PATTERN.search(data, start + chunk_size)
+            end = split.start() if split else size
+            yield start, end
+            start = end
+
+def _summarize_range(chunk_range: Tuple[str, int, int]) -> ChunkSummary:
+    path, start, end = chunk_range
+    with open(path, "rb") as f:
+        f.seek(start)
+        return summarize_chunk(f.read(end - start))
+
+def calculate_results_parallel(path: str, chunk_size: int = CHUNK_SIZE, processes: int = None) -> Tuple[int, int]:
+    """
+    Calculate the results of both parts by summarizing chunks of the file in a process pool.
+
+    The chunk summaries are composed from left to right, which gives the exact result of part 2.
+
+    :param path: path to the file
+    :param chunk_size: number of bytes per chunk
+    :param processes: number of worker processes, defaults to the number of cpus
+    :return: results of part 1 and part 2
     """
+    chunk_ranges = ((path, start, end) for start, end in split_input(path, chunk_size))
     result = 0
+    result_part2 = 0
     multiply = True
-    for match in find_regex_part2(data):
-        if "don't()" in match:
-            multiply = False
-        elif "do()" in match:
-            multiply = True
-        elif "mul" in match and multiply:
-            x, y = parse_mult(match)
-            result += x * y
-    return result
+    with Pool(processes) as pool:
+        for summary in pool.imap(_summarize_range, chunk_ranges):
+            result += summary.result
+            result_part2 += summary.result_if_enabled if multiply else summary.result_if_disabled
+            if summary.exit_state is not None:
+                multiply = summary.exit_state
+    return result, result_part2
 
 if __name__ == "__main__":
     data = read_data("input.txt")
@@ -1,16 +1,61 @@
-from typing import List, Tuple
+from collections import deque
+from multiprocessing import Pool
+import mmap
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 
 
+BORDER = 0
+BAND_ROWS = 1024
+
+DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+
 class WordGrid():
-    def __init__(self, data: List[str]):
-        self.data = data
+    """
+    Grid of letters stored as one flat bytes object, surrounded by a border of BORDER bytes.
+
+    Row y starts at (y + padding) * stride + padding, so reading along a direction is a
+    strided slice, and any read that starts in the grid and is at most padding long never
+    leaves the buffer.
+    """
+    def __init__(self, data: List[str], padding: int = 1):
         self.width = len(data[0])
         self.height = len(data)
+        self.padding = 0
+        self.stride = self.width
+        self.cells = b''.join(row if isinstance(row, bytes) else ''.join(row).encode('ascii') for row in data)
+        self.pad(padding)
+
+    def pad(self, padding: int):
+        """
+        Make sure the border around the grid is at least padding cells wide.
+        """
+        if padding <= self.padding:
+            return
+        stride = self.width + 2 * padding
+        border_row = bytes([BORDER]) * stride
+        side = bytes([BORDER]) * padding
+        rows = [border_row] * padding
+        for y in range(self.height):
+            start = self.index(0, y)
+            rows.append(side + self.cells[start:start + self.width] + side)
+        rows.extend([border_row] * padding)
+        self.cells = b''.join(rows)
+        self.padding = padding
+        self.stride = stride
+        self._letter_masks = {}
+
+    def index(self, x: int, y: int) -> int:
+        return (y + self.padding) * self.stride + x + self.padding
+
+    def step(self, dx: int, dy: int) -> int:
+        return dy * self.stride + dx
 
     def get_char(self, x: int, y: int) -> str:
         self._check_input(x, y)
-        return self.data[y][x]
+        return chr(self.cells[self.index(x, y)])
 
     def _check_input(self, x: int, y: int) -> bool:
         if x < 0 or y < 0:
@@ -19,132 +64,277 @@ class WordGrid():
             raise ValueError('x and y must be within the grid')
         return True
 
+    def read(self, x: int, y: int, dx: int, dy: int, len: int) -> str:
+        """
+        Read len letters starting at (x, y) in direction (dx, dy), None if they leave the grid.
+        """
+        end_x = x + dx * (len - 1)
+        end_y = y + dy * (len - 1)
+        if not (0 <= min(x, end_x) and max(x, end_x) < self.width and 0 <= min(y, end_y) and max(y, end_y) < self.height):
+            return None
+        start = self.index(x, y)
+        step = self.step(dx, dy)
+        return self.cells[start:start + step * len:step].decode('ascii')
+
     def get_horizontal_right(self, x: int, y: int, len: int) -> str:
-        word = ''
-        for i in range(len):
-            try:
-                word += self.get_char(x + i, y)
-            except:
-                return None
-        return word
+        return self.read(x, y, 1, 0, len)
 
     def get_horizontal_left(self, x: int, y: int, len: int) -> str:
-        word = ''
-        for i in range(len):
-            try:
-                word += self.get_char(x - i, y)
-            except:
-                return None
-        return word
+        return self.read(x, y, -1, 0, len)
 
     def get_vertical_down(self, x: int, y: int, len: int) -> str:
-        word = ''
-        for i in range(len):
-            try:
-                word += self.get_char(x, y + i)
-            except:
-                return None
-        return word
+        return self.read(x, y, 0, 1, len)
 
     def get_vertical_up(self, x: int, y: int, len: int) -> str:
-        word = ''
-        for i in range(len):
-            try:
-                word += self.get_char(x, y - i)
-            except:
-                return None
-        return word
+        return self.read(x, y, 0, -1, len)
 
     def get_diagonal_down_right(self, x: int, y: int, len: int) -> str:
-        word = ''
-        for i in range(len):
-            try:
-                word += self.get_char(x + i, y + i)
-            except:
-                return None
-        return word
+        return self.read(x, y, 1, 1, len)
 
     def get_diagonal_down_left(self, x: int, y: int, len: int) -> str:
-        word = ''
-        for i in range(len):
-            try:
-                word += self.get_char(x - i, y + i)
-            except:
-                return None
-        return word
+        return self.read(x, y, -1, 1, len)
 
     def get_diagonal_up_right(self, x: int, y: int, len: int) -> str:
-        word = ''
-        for i in range(len):
-            try:
-                word += self.get_char(x + i, y - i)
-            except:
-                return None
-        return word
+        return self.read(x, y, 1, -1, len)
 
     def get_diagonal_up_left(self, x: int, y: int, len: int) -> str:
-        word = ''
-        for i in range(len):
-            try:
-                word += self.get_char(x - i, y - i)
-            except:
-                return None
-        return word
+        return self.read(x, y, -1, -1, len)
+
+    def letter_mask(self, char: str) -> int:
+        """
+        Mask with bit i set if cell i of the buffer holds char, one bit per cell.
+
+        The buffer is translated to a string of binary digits, parsing it is linear in its length.
+        """
+        mask = self._letter_masks.get(char)
+        if mask is None:
+            table = bytearray(b'0') * 256
+            table[ord(char)] = ord('1')
+            mask = int(self.cells.translate(table)[::-1], 2)
+            self._letter_masks[char] = mask
+        return mask
+
+    def clear_masks(self):
+        """
+        Drop the cached letter masks.
+        """
+        self._letter_masks = {}
+
+    def __getstate__(self) -> dict:
+        # pickled as the padded buffer only, the letter masks are rebuilt on demand
+        state = self.__dict__.copy()
+        del state['_letter_masks']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._letter_masks = {}
+
+    def match_mask(self, word: str, start: int, step: int) -> int:
+        """
+        Mask of the cells i for which word can be read from i + start with the given step.
+
+        Every letter mask is shifted so that the letter it is checked against lines up with
+        the anchor cell, then all of them are ANDed together.
+        """
+        mask = (1 << len(self.cells)) - 1
+        for k, char in enumerate(word):
+            offset = start + k * step
+            letter_mask = self.letter_mask(char)
+            mask &= letter_mask >> offset if offset >= 0 else letter_mask << -offset
+        return mask
+
+    def lines(self) -> Iterator[bytes]:
+        """
+        Yield the rows, columns and both diagonal families of the grid, read forwards.
+
+        Strided slices over the whole buffer are used, the border keeps lines apart.
+        """
+        yield self.cells
+        for step in (self.step(0, 1), self.step(1, 1), self.step(-1, 1)):
+            for start in range(step):
+                yield self.cells[start::step]
+
+    def rows_mask(self, start: int, end: int) -> int:
+        """
+        Mask of all cells of the buffer in the rows start up to end.
+        """
+        return (1 << self.index(0, end)) - (1 << self.index(0, start))
+
+    def positions(self, mask: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yield the (x, y) coordinates of the cells set in a mask.
+        """
+        flags = format(mask, 'b')[::-1]
+        i = flags.find('1')
+        while i != -1:
+            y, x = divmod(i, self.stride)
+            yield x - self.padding, y - self.padding
+            i = flags.find('1', i + 1)
 
 
 class WordSearch():
-    def __init__(self, grid: WordGrid, word = 'XMAS'):
+    WORD = 'XMAS'
+
+    def __init__(self, grid: WordGrid, word = None):
         self.grid = grid
-        self.word = word
+        self.word = self.WORD if word is None else word
         self.count = 0
         self.word_length = len(self.word)
+        self.grid.pad(self.word_length + 1)
+
+    def direction_masks(self) -> Iterator[Tuple[Tuple[int, int], int]]:
+        """
+        Yield the match mask of every direction, only one of them is built at a time.
+        """
+        for dx, dy in DIRECTIONS:
+            yield (dx, dy), self.grid.match_mask(self.word, 0, self.grid.step(dx, dy))
 
     def search(self):
-        for y in range(self.grid.height):
-            for x in range(self.grid.width):
-                if self.grid.get_char(x, y) == self.word[0]:
-                    if self.grid.get_horizontal_right(x, y, self.word_length) == self.word:
-                        self.count += 1
-                    if self.grid.get_horizontal_left(x, y, self.word_length) == self.word:
-                        self.count += 1
-                    if self.grid.get_vertical_down(x, y, self.word_length) == self.word:
-                        self.count += 1
-                    if self.grid.get_vertical_up(x, y, self.word_length) == self.word:
-                        self.count += 1
-                    if self.grid.get_diagonal_down_right(x, y, self.word_length) == self.word:
-                        self.count += 1
-                    if self.grid.get_diagonal_down_left(x, y, self.word_length) == self.word:
-                        self.count += 1
-                    if self.grid.get_diagonal_up_right(x, y, self.word_length) == self.word:
-                        self.count += 1
-                    if self.grid.get_diagonal_up_left(x, y, self.word_length) == self.word:
-                        self.count += 1
+        for _, mask in self.direction_masks():
+            self.count += mask.bit_count()
+        self.grid.clear_masks()
         return self.count
 
+    def search_rows(self, start: int, end: int) -> int:
+        """
+        Count the matches with their first letter in the rows start up to end.
+        """
+        rows = self.grid.rows_mask(start, end)
+        count = sum((mask & rows).bit_count() for _, mask in self.direction_masks())
+        self.grid.clear_masks()
+        return count
+
+    def find_matches(self) -> List[Tuple[int, int, int, int]]:
+        """
+        Find all matches as (x, y, dx, dy), the first letter and the direction of the word.
+        """
+        matches = [
+            (x, y, dx, dy)
+            for (dx, dy), mask in self.direction_masks()
+            for x, y in self.grid.positions(mask)
+        ]
+        self.grid.clear_masks()
+        return matches
+
 class MasSearch(WordSearch):
-    def __init__(self, grid: WordGrid, word = 'MAS'):
+    WORD = 'MAS'
+
+    def __init__(self, grid: WordGrid, word = None):
+        if word is not None and len(word) != 3:
+            raise ValueError('The arms of an X are 3 letters long')
         super().__init__(grid, word)
 
+    def mask(self) -> int:
+        grid = self.grid
+        down_right = grid.step(1, 1)
+        down_left = grid.step(-1, 1)
+        return (
+            (grid.match_mask(self.word, -down_right, down_right) | grid.match_mask(self.word, down_right, -down_right))
+            & (grid.match_mask(self.word, -down_left, down_left) | grid.match_mask(self.word, down_left, -down_left))
+        )
+
     def search(self):
-        for y in range(self.grid.height):
-            for x in range(self.grid.width):
-                if self.grid.get_char(x, y) == self.word[1]:
-                    if (
-                        (
-                            (self.grid.get_diagonal_down_right(x-1, y-1, self.word_length) == self.word)
-                            or
-                            (self.grid.get_diagonal_up_left(x+1, y+1, self.word_length) == self.word)
-                        )
-                        and
-                        (
-                            (self.grid.get_diagonal_down_left(x+1, y-1, self.word_length) == self.word)
-                            or
-                            (self.grid.get_diagonal_up_right(x-1, y+1, self.word_length) == self.word)
-                        )
-                    ):
-                        self.count += 1
+        self.count += self.mask().bit_count()
+        self.grid.clear_masks()
         return self.count
 
+    def search_rows(self, start: int, end: int) -> int:
+        """
+        Count the X-MAS with their centre in the rows start up to end.
+        """
+        count = (self.mask() & self.grid.rows_mask(start, end)).bit_count()
+        self.grid.clear_masks()
+        return count
+
+    def find_matches(self) -> List[Tuple[int, int]]:
+        """
+        Find the (x, y) coordinates of the centre of every X-MAS.
+        """
+        matches = list(self.grid.positions(self.mask()))
+        self.grid.clear_masks()
+        return matches
+
+
+class AhoCorasick():
+    """
+    Aho-Corasick automaton for counting the occurrences of many words at once.
+
+    The transitions are completed for the alphabet of the words, so scanning a text is a
+    single lookup per character. Visits are counted per state and pushed down the failure
+    links afterwards, which keeps the scan independent of the number of matches.
+    """
+    def __init__(self, words: Iterable[str]):
+        self.transitions: List[Dict[int, int]] = [{}]
+        self.terminals: Dict[str, int] = {}
+        for word in words:
+            state = 0
+            for char in word.encode('ascii'):
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            self.terminals[word] = state
+        self.failures = [0] * len(self.transitions)
+        self.order = self._complete_transitions()
+
+    def _complete_transitions(self) -> List[int]:
+        alphabet = {char for transitions in self.transitions for char in transitions}
+        order = []
+        queue = deque()
+        for char in alphabet:
+            child = self.transitions[0].setdefault(char, 0)
+            if child:
+                queue.append(child)
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            failure = self.transitions[self.failures[state]]
+            for char in alphabet:
+                child = self.transitions[state].get(char)
+                if child is None:
+                    self.transitions[state][char] = failure[char]
+                else:
+                    self.failures[child] = failure[char]
+                    queue.append(child)
+        return order
+
+    def count(self, texts: Iterable[bytes]) -> Dict[str, int]:
+        """
+        Count the occurrences of every word in the texts, overlapping ones included.
+        """
+        transitions = self.transitions
+        visits = [0] * len(transitions)
+        for text in texts:
+            state = 0
+            for char in text:
+                state = transitions[state].get(char, 0)
+                visits[state] += 1
+        for state in reversed(self.order):
+            visits[self.failures[state]] += visits[state]
+        return {word: visits[state] for word, state in self.terminals.items()}
+
+class MultiWordSearch():
+    """
+    Count every word of a dictionary in all eight directions with a single automaton.
+    """
+    def __init__(self, grid: WordGrid, words: Iterable[str]):
+        self.grid = grid
+        self.words = list(words)
+        self.grid.pad(1)
+
+    def search(self) -> Dict[str, int]:
+        automaton = AhoCorasick(self.words)
+        return automaton.count(self._texts())
+
+    def _texts(self) -> Iterator[bytes]:
+        """
+        Yield every line forwards and backwards, only one line and its reverse are held at a time.
+        """
+        for line in self.grid.lines():
+            yield line
+            yield line[::-1]
+
 
 def read_data(path: str) -> List[List[int]]:
     """
@@ -160,6 +350,50 @@ def read_data(path: str) -> List[List[int]]:
     return data
 
 
+def _search_band(band: Tuple[str, type, str, int, int, int]) -> int:
+    path, search_class, word, halo, start, end = band
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        width = data.find(b"\n")
+        width = len(data) if width == -1 else width
+        stride = width + 1
+        height = (len(data) + stride - 1) // stride
+        band_start = max(0, start - halo)
+        band_end = min(height, end + halo)
+        rows = [data[y * stride:y * stride + width].rstrip(b"\r") for y in range(band_start, band_end)]
+    search = search_class(WordGrid(rows), word)
+    return search.search_rows(start - band_start, end - band_start)
+
+
+def tiled_search(path: str, search_class: type = WordSearch, word: str = None, band_rows: int = BAND_ROWS, processes: int = None) -> int:
+    """
+    Run a WordSearch or MasSearch over bands of rows of the file in a process pool.
+
+    Every worker maps the file and searches its band plus a halo of len(word) - 1 rows on
+    each side, but only counts matches anchored in its own rows, so the result is exactly
+    the one of the serial search.
+
+    :param path: path to the file
+    :param search_class: WordSearch or MasSearch
+    :param word: word to search for, defaults to the word of search_class
+    :param band_rows: number of rows per band
+    :param processes: number of worker processes, defaults to the number of cpus
+    :return: number of matches
+    """
+    with open(path, "rb") as f:
+        first_row = f.readline()
+    stride = len(first_row) if first_row.endswith(b"\n") else len(first_row) + 1
+    height = (os.path.getsize(path) + stride - 1) // stride
+    if word is None:
+        word = search_class.WORD
+    halo = len(word) - 1
+    bands = [
+        (path, search_class, word, halo, start, min(start + band_rows, height))
+        for start in range(0, height, band_rows)
+    ]
+    with Pool(processes) as pool:
+        return sum(pool.imap_unordered(_search_band, bands))
+
+
 
 if __name__ == "__main__":
     data = read_data("input.txt")
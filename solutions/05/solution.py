@@ -1,4 +1,8 @@
-from typing import List, Tuple
+from collections import defaultdict, deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+CACHE_SIZE = 1 << 16
 
 class Rule:
     def __init__(self, string: str):
@@ -28,6 +32,108 @@ class Rule:
 
 
 
+class RuleSet:
+    """
+    Index of the rules, mapping every page to the set of pages that must come after it.
+
+    Every rule is reference counted, a rule that was added several times stays in place
+    until it is removed as often.
+    """
+    def __init__(self, rules: Iterable[Rule] = ()):
+        self.successors: Dict[int, Set[int]] = defaultdict(set)
+        self.counts: Dict[Tuple[int, int], int] = defaultdict(int)
+        for rule in rules:
+            self.add(rule.x, rule.y)
+
+    def add(self, x: int, y: int) -> bool:
+        """
+        Add a rule, return True if it was not in the set before.
+        """
+        self.counts[x, y] += 1
+        if self.counts[x, y] > 1:
+            return False
+        self.successors[x].add(y)
+        return True
+
+    def remove(self, x: int, y: int) -> bool:
+        """
+        Remove a rule once, return True if it is no longer in the set.
+        """
+        count = self.counts.get((x, y), 0)
+        if count > 1:
+            self.counts[x, y] = count - 1
+            return False
+        if count == 0:
+            return False
+        del self.counts[x, y]
+        self.successors[x].discard(y)
+        return True
+
+    def pairs(self) -> Iterator[Tuple[int, int]]:
+        for x, successors in self.successors.items():
+            for y in successors:
+                yield x, y
+
+    def restrict(self, data: List[int]) -> "RuleSet":
+        """
+        Get the rules that apply to the data, i.e. the ones with both pages in it.
+        """
+        pages = set(data)
+        rule_set = RuleSet()
+        for x in pages:
+            for y in self.successors.get(x, set()) & pages:
+                rule_set.add(x, y)
+        return rule_set
+
+    def check_list(self, data: List[int]) -> bool:
+        """
+        Check if all rules are satisfied by the data, in a single pass over it.
+        """
+        seen = set()
+        for page in data:
+            successors = self.successors.get(page)
+            if successors and not successors.isdisjoint(seen):
+                return False
+            seen.add(page)
+        return True
+
+
+class PrecedenceMatrix:
+    """
+    Dense matrix of the rules, row y has a 1 in column x if x must come before y.
+
+    Page numbers are small, so every row is an int with one bit per page. The matrix is
+    sized by the largest page in the rules only. Results are cached per tuple of pages, so
+    updates that come in repeatedly are only checked once.
+    """
+    def __init__(self, rules: RuleSet, cache_size: int = CACHE_SIZE):
+        self.rules = rules
+        self.size = max((max(x, y) for x, y in rules.pairs()), default=-1) + 1
+        self.rows: List[int] = [0] * self.size
+        for x, y in rules.pairs():
+            self.rows[y] |= 1 << x
+        self.check = lru_cache(maxsize=cache_size)(self._check)
+
+    def _check(self, update: Tuple[int, ...]) -> bool:
+        # a single pass, every page must not be required before any of the pages ahead of it
+        size = self.size
+        rows = self.rows
+        before = 0
+        for page in update:
+            # pages beyond the matrix are in no rule, so they cannot be out of order
+            if page < size:
+                if before >> page & 1:
+                    return False
+                before |= rows[page]
+        return True
+
+    def check_updates(self, updates: Iterable[List[int]]) -> List[bool]:
+        """
+        Check a batch of updates, True for every update that satisfies all rules.
+        """
+        return list(map(self.check, map(tuple, updates)))
+
+
 def get_middle_element(data: List[int]) -> int:
     """
     Get the middle element of a list of integers.
@@ -61,45 +167,178 @@ def check_all_rules(rules: List[Rule], data: List[int]) -> bool:
     return all(rule.check_list(data) for rule in rules)
 
 
-def solve_part_1(rules: List[Rule], updates: List[List[int]]) -> int:
+def solve_part_1(rules: RuleSet, updates: List[List[int]]) -> int:
     """
     Solve part 1 of the puzzle.
     """
     count = 0
     for update in updates:
-        if check_all_rules(rules, update):
+        if rules.check_list(update):
             count += get_middle_element(update)
     return count
 
 
-def reorder_update(rules, update):
+def find_cycle(successors: Dict[int, Set[int]], pages: Set[int]) -> List[int]:
+    """
+    Find a cycle among pages in which every page has a predecessor.
+    """
+    predecessors = {}
+    for x in pages:
+        for y in successors.get(x, set()) & pages:
+            predecessors[y] = x
+    page = next(iter(pages))
+    path = []
+    visited = {}
+    while page not in visited:
+        visited[page] = len(path)
+        path.append(page)
+        page = predecessors[page]
+    return path[visited[page]:][::-1]
+
+
+def topological_sort(rules: RuleSet, update: List[int]) -> List[int]:
+    """
+    Order the pages of the update according to the rules, using Kahn's algorithm.
+
+    Raises a ValueError if the rules that apply to the update contain a cycle.
+    """
+    successors = rules.restrict(update).successors
+    in_degree = dict.fromkeys(update, 0)
+    for x in update:
+        for y in successors.get(x, ()):
+            in_degree[y] += 1
+
+    queue = deque(page for page in update if in_degree[page] == 0)
+    order = []
+    while queue:
+        x = queue.popleft()
+        order.append(x)
+        for y in successors.get(x, ()):
+            in_degree[y] -= 1
+            if in_degree[y] == 0:
+                queue.append(y)
+
+    if len(order) < len(in_degree):
+        remaining = {page for page, degree in in_degree.items() if degree > 0}
+        cycle = find_cycle(successors, remaining)
+        raise ValueError(f"Rules contain a cycle: {' | '.join(map(str, cycle + cycle[:1]))}")
+    return order
+
+
+def reorder_update(rules: RuleSet, update):
     """
     Reorder the update list according to the rules.
     """
-    while not check_all_rules(rules, update):
-        for rule in rules:
-            x_index = update.index(rule.x)
-            y_index = update.index(rule.y)
-            if x_index > y_index:
-                update[x_index], update[y_index] = update[y_index], update[x_index]
+    update[:] = topological_sort(rules, update)
     return update
 
 
-def solve_part_2(rules: List[Rule], updates: List[List[int]]) -> int:
+def get_reordered_middle_element(rules: RuleSet, update: List[int]) -> int:
+    """
+    Get the middle element of the update after reordering it.
+
+    If the rules fully order the pages, the number of pages that must come after a page
+    gives its position directly and only that order has to be checked. Otherwise the
+    update is sorted topologically.
+    """
+    pages = set(update)
+    order = [None] * len(update)
+    for page in update:
+        position = len(update) - 1 - len(rules.successors.get(page, set()) & pages)
+        if position < 0 or order[position] is not None:
+            break
+        order[position] = page
+    else:
+        if rules.check_list(order):
+            return get_middle_element(order)
+    return get_middle_element(topological_sort(rules, update))
+
+
+def solve_part_2(rules: RuleSet, updates: List[List[int]]) -> int:
     """
     Solve part 2 of the puzzle.
     """
     count = 0
     for update in updates:
-        if check_all_rules(rules, update):
+        if rules.check_list(update):
             continue
 
-        rules_to_apply = [rule for rule in rules if rule.check_rule_applies(update)]
-        update = reorder_update(rules_to_apply, update)
-        count += get_middle_element(update)
+        count += get_reordered_middle_element(rules, update)
     return count
 
+
+def solve_batch(rules: RuleSet, updates: List[List[int]]) -> Tuple[int, int]:
+    """
+    Solve both parts of the puzzle, checking all updates against a PrecedenceMatrix at once.
+    """
+    matrix = PrecedenceMatrix(rules)
+    count_1 = 0
+    count_2 = 0
+    for update, valid in zip(updates, matrix.check_updates(updates)):
+        if valid:
+            count_1 += get_middle_element(update)
+        else:
+            count_2 += get_reordered_middle_element(rules, update)
+    return count_1, count_2
+
+class RuleEngine:
+    """
+    Keeps the solutions of both parts up to date while rules and updates come in.
+
+    An inverted index from page to updates is kept, so a rule change only re-evaluates the
+    updates that contain both of its pages.
+    """
+    def __init__(self):
+        self.rules = RuleSet()
+        self.updates: List[List[int]] = []
+        self.updates_by_page: Dict[int, Set[int]] = defaultdict(set)
+        self.contributions: List[Tuple[int, int]] = []
+        self.part_1 = 0
+        self.part_2 = 0
+
+    def _evaluate(self, update: List[int]) -> Tuple[int, int]:
+        if self.rules.check_list(update):
+            return get_middle_element(update), 0
+        return 0, get_reordered_middle_element(self.rules, update)
+
+    def _apply(self, index: int, contribution: Tuple[int, int]):
+        old_1, old_2 = self.contributions[index]
+        self.part_1 += contribution[0] - old_1
+        self.part_2 += contribution[1] - old_2
+        self.contributions[index] = contribution
+
+    def _change_rule(self, rule: Rule, change, undo):
+        if not change(rule.x, rule.y):
+            return
+        affected = self.updates_by_page.get(rule.x, set()) & self.updates_by_page.get(rule.y, set())
+        try:
+            contributions = [(index, self._evaluate(self.updates[index])) for index in affected]
+        except ValueError:
+            undo(rule.x, rule.y)
+            raise
+        for index, contribution in contributions:
+            self._apply(index, contribution)
+
+    def add_rule(self, rule: Rule):
+        """
+        Add a rule, raises a ValueError and ignores the rule if it creates a cycle in an update.
+        """
+        self._change_rule(rule, self.rules.add, self.rules.remove)
+
+    def remove_rule(self, rule: Rule):
+        self._change_rule(rule, self.rules.remove, self.rules.add)
+
+    def add_update(self, update: List[int]):
+        contribution = self._evaluate(update)
+        index = len(self.updates)
+        self.updates.append(update)
+        self.contributions.append((0, 0))
+        for page in update:
+            self.updates_by_page[page].add(index)
+        self._apply(index, contribution)
+
 if __name__ == "__main__":
     rules, updates = read_data("input.txt")
+    rules = RuleSet(rules)
     print(solve_part_1(rules, updates))
     print(solve_part_2(rules, updates))
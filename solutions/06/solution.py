@@ -1,79 +1,237 @@
 from typing import List, Tuple
-from enum import Enum
-from copy import deepcopy
+from array import array
+from itertools import islice
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
 
 OBSTACLE = "#"
 FREE = "."
 START = "^"
+BATCH_SIZE = 256
+# bytes per entry of the table of stops
+STOP_SIZE = array("q").itemsize
 
-class Direction(Enum):
+class Direction:
+    """
+    Integer codes of the directions, in clockwise order.
+    """
     UP = 0
     RIGHT = 1
     DOWN = 2
     LEFT = 3
 
-    def turn_right(self):
-        return Direction((self.value + 1) % 4)
-
-    def take_step(self, x: int, y: int) -> Tuple[int, int]:
-        if self == Direction.UP:
-            return x, y - 1
-        elif self == Direction.RIGHT:
-            return x + 1, y
-        elif self == Direction.DOWN:
-            return x, y + 1
-        elif self == Direction.LEFT:
-            return x - 1, y
-        else:
-            raise ValueError("Invalid direction")
+DIRECTIONS = 4
+TURN_RIGHT = (Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP)
+DELTAS = ((0, -1), (1, 0), (0, 1), (-1, 0))
 
 class Map:
+    """
+    The lab as a flat bytearray, positions are cell indices y * width + x.
+
+    A state of the guard is encoded as position * DIRECTIONS + direction.
+    """
     def __init__(self, data: List[List[str]]):
-        self.data = data
-        self.width = len(data[0])
-        self.height = len(data)
-        self.current_position = self._find_start()
-        self.current_direction = Direction.UP
-        self.former_positions = set()
-        self.former_positions_and_directions = set()
-        self.log_current_position()
+        cells = bytearray("".join("".join(row) for row in data).encode())
+        self._load(len(data[0]), len(data), cells)
+
+    @classmethod
+    def from_tables(cls, width: int, height: int, cells: bytearray, stops: List[array]) -> "Map":
+        """
+        Build a map from its cells and an already built table of stops, without indexing the obstacles.
+        """
+        map = cls.__new__(cls)
+        map._load(width, height, cells, stops)
+        return map
+
+    def _load(self, width: int, height: int, cells: bytearray, stops: List[array] = None):
+        self.width = width
+        self.height = height
+        self.cells = cells
+        self.steps = tuple(dy * self.width + dx for dx, dy in DELTAS)
+        if stops is None:
+            self._index_obstacles()
+        else:
+            self.stops = stops
+        self.start = self._find_start()
+        # states in which the guard turned, stamped with the generation of the walk they belong to
+        self.turns = array("Q", [0]) * (self.width * self.height * DIRECTIONS)
+        self.generation = 0
+        self.reset()
+
+    def __getstate__(self) -> dict:
+        """
+        Pickle the cells and the table of stops as raw bytes, the state of the walk is not kept.
+        """
+        return {
+            "width": self.width,
+            "height": self.height,
+            "cells": bytes(self.cells),
+            "stops": [stops.tobytes() for stops in self.stops],
+        }
+
+    def __setstate__(self, state: dict):
+        stops = []
+        for raw in state["stops"]:
+            table = array("q")
+            table.frombytes(raw)
+            stops.append(table)
+        self._load(state["width"], state["height"], bytearray(state["cells"]), stops)
+
+    def _index_obstacles(self):
+        """
+        Build the table of where the guard stops when walking straight ahead, per direction and position.
+
+        A stop is the last position before the next obstacle, or -(position + 1) for the last
+        position on the map if the guard leaves it. Every row and every column is swept once,
+        the positions between two obstacles get their stops with one slice assignment.
+        """
+        width, height = self.width, self.height
+        rows = [[] for _ in range(height)]
+        columns = [[] for _ in range(width)]
+        position = self.cells.find(ord(OBSTACLE))
+        while position != -1:
+            y, x = divmod(position, width)
+            rows[y].append(position)
+            columns[x].append(position)
+            position = self.cells.find(ord(OBSTACLE), position + 1)
 
-    def _find_start(self) -> Tuple[int, int]:
-        for y, row in enumerate(self.data):
-            for x, char in enumerate(row):
-                if char == START:
-                    return x, y
-        raise ValueError("No start found")
+        self.stops = [array("q", [0]) * (width * height) for _ in range(DIRECTIONS)]
+        for y, obstacles in enumerate(rows):
+            self._sweep(Direction.RIGHT, Direction.LEFT, y * width, y * width + width, 1, obstacles)
+        for x, obstacles in enumerate(columns):
+            self._sweep(Direction.DOWN, Direction.UP, x, x + height * width, width, obstacles)
+
+    def _sweep(self, forward: int, backward: int, start: int, end: int, step: int, obstacles: List[int]):
+        """
+        Fill the stops along a row or a column with the given obstacles, in both directions.
+
+        The stops of an obstacle are the ones it would have if it was removed.
+        """
+        # walking backward, the guard stops right after the previous obstacle
+        previous, stop = start, -(start + 1)
+        for obstacle in obstacles:
+            self._fill(backward, previous, obstacle + step, step, stop)
+            previous, stop = obstacle + step, obstacle + step
+        self._fill(backward, previous, end, step, stop)
+        # walking forward, the guard stops right before the next obstacle
+        previous = start
+        for obstacle in obstacles:
+            self._fill(forward, previous, obstacle, step, obstacle - step)
+            previous = obstacle
+        self._fill(forward, previous, end, step, -(end - step + 1))
+
+    def _fill(self, direction: int, start: int, end: int, step: int, stop: int):
+        self.stops[direction][start:end:step] = array("q", [stop]) * len(range(start, end, step))
+
+    def _spans(self, position: int) -> List[Tuple[int, int, int, int]]:
+        """
+        The positions whose stops depend on an obstacle at position, as (direction, start, end, step)
+        slices of the table, up to and including the neighbouring obstacles in the row and the column.
+
+        The stops of an obstacle are kept as if only that obstacle was removed, so they can be
+        copied over when it is removed.
+        """
+        up, right, down, left = (
+            stops[position] + step if stops[position] >= 0 else -stops[position] - 1
+            for stops, step in zip(self.stops, self.steps)
+        )
+        return [
+            (Direction.DOWN, up, position, self.width),
+            (Direction.LEFT, position + 1, right + 1, 1),
+            (Direction.UP, position + self.width, down + self.width, self.width),
+            (Direction.RIGHT, left, position, 1),
+        ]
+
+    def _block(self, position: int):
+        for direction, start, end, step in self._spans(position):
+            self._fill(direction, start, end, step, position - self.steps[direction])
+
+    def _unblock(self, position: int):
+        for direction, start, end, step in self._spans(position):
+            self._fill(direction, start, end, step, self.stops[direction][position])
+
+    def _find_start(self) -> int:
+        position = self.cells.find(ord(START))
+        if position == -1:
+            raise ValueError("No start found")
+        return position
 
     def log_current_position(self):
-        self.former_positions.add(self.current_position)
-        self.former_positions_and_directions.add((self.current_position, self.current_direction))
+        """
+        Mark the current position as visited, the first time also log the state the guard entered it from.
+        """
+        if not self.visited[self.current_position]:
+            self.visited[self.current_position] = 1
+            self.path.append(self.current_position)
+            self.entry_states.append(self.current_position * DIRECTIONS + self.current_direction)
+
+    def new_walk(self):
+        """
+        Forget all logged turns in O(1) by starting a new generation.
+        """
+        self.generation += 1
+
+    def log_turn(self) -> bool:
+        """
+        Log that the guard turns in its current state, return True if it already did in this walk.
+        """
+        state = self.current_position * DIRECTIONS + self.current_direction
+        if self.turns[state] == self.generation:
+            return True
+        self.turns[state] = self.generation
+        return False
 
     def get_char(self, x: int, y: int) -> str:
-        return self.data[y][x]
+        return chr(self.cells[y * self.width + x])
+
+    def next_turn(self) -> Tuple[int, bool]:
+        """
+        Find the position where the guard stops walking straight ahead, from the table of stops.
 
-    def is_out_of_bounds(self, position: Tuple[int, int]) -> bool:
-        x, y = position
-        return x < 0 or x >= self.width or y < 0 or y >= self.height
+        :return: the last position before the next obstacle and False, or the last position
+            on the map and True if the guard leaves the map
+        """
+        stop = self.stops[self.current_direction][self.current_position]
+        return (stop, False) if stop >= 0 else (-stop - 1, True)
 
-    def next_position(self) -> Tuple[int, int]:
-        x, y = self.current_position
-        return self.current_direction.take_step(x, y)
+    def walk_to(self, position: int):
+        """
+        Move the guard straight ahead to position, logging the cells it walks over and the
+        state it was in right before it first entered each of them.
+        """
+        step = self.steps[self.current_direction]
+        visited = self.visited
+        previous = self.current_position
+        for cell in range(previous + step, position + step, step):
+            if not visited[cell]:
+                visited[cell] = 1
+                self.path.append(cell)
+                self.entry_states.append(previous * DIRECTIONS + self.current_direction)
+            previous = cell
+        self.current_position = position
 
     def reset(self):
-        self.current_position = self._find_start()
+        self.current_position = self.start
         self.current_direction = Direction.UP
-        self.former_positions = set()
-        self.former_positions_and_directions = set()
+        self.visited = bytearray(self.width * self.height)
+        # visited positions in the order of their first visit, with the state right before it
+        self.path = array("q")
+        self.entry_states = array("q")
+        self.new_walk()
         self.log_current_position()
 
-    def add_obstacle(self, position: Tuple[int, int]):
-        x, y = position
-        self.data[y][x] = OBSTACLE
+    def add_obstacle(self, position: int):
+        """
+        Add an obstacle, only the stops in its row and column up to the next obstacles are updated.
+        """
+        if self.cells[position] != ord(OBSTACLE):
+            self._block(position)
+        self.cells[position] = ord(OBSTACLE)
 
-    def remove_obstacle(self, position: Tuple[int, int]):
-        x, y = position
-        self.data[y][x] = FREE
+    def remove_obstacle(self, position: int):
+        if self.cells[position] == ord(OBSTACLE):
+            self._unblock(position)
+        self.cells[position] = ord(START) if position == self.start else ord(FREE)
 
 
 def read_data(path: str) -> List[List[str]]:
@@ -86,53 +244,96 @@ def read_data(path: str) -> List[List[str]]:
 
 def solve_part_1(map: Map) -> int:
     while True:
-        possible_position = map.next_position()
-
-        if map.is_out_of_bounds(possible_position):
+        position, leaves_map = map.next_turn()
+        map.walk_to(position)
+        if leaves_map:
             break
+        map.current_direction = TURN_RIGHT[map.current_direction]
 
-        if map.get_char(*possible_position) == OBSTACLE:
-            map.current_direction = map.current_direction.turn_right()
-            continue
-        elif map.get_char(*possible_position) == FREE or map.get_char(*possible_position) == START:
-            map.current_position = possible_position
-            map.log_current_position()
-        else:
-            raise ValueError("Invalid character")
-
-    return len(map.former_positions)
+    return len(map.path)
 
 
 def does_it_loop(map: Map):
+    """
+    Check if the guard walks in a loop, only the states in which it turns are logged.
+    """
+    map.new_walk()
     while True:
-        possible_position = map.next_position()
-        if (possible_position, map.current_direction) in map.former_positions_and_directions:
+        position, leaves_map = map.next_turn()
+        if leaves_map:
+            return False
+
+        map.current_position = position
+        if map.log_turn():
             return True
+        map.current_direction = TURN_RIGHT[map.current_direction]
 
-        if map.is_out_of_bounds(possible_position):
-            return False
+def count_loops(map: Map, candidates: List[Tuple[int, int]]) -> int:
+    """
+    Count the candidate obstacle positions that make the guard loop.
 
-        if map.get_char(*possible_position) == OBSTACLE:
-            map.current_direction = map.current_direction.turn_right()
-            continue
-        elif map.get_char(*possible_position) == FREE or map.get_char(*possible_position) == START:
-            map.current_position = possible_position
-            map.log_current_position()
-        else:
-            raise ValueError("Invalid character")
+    The obstacle is placed on the map itself and the guard starts from the given entry state,
+    the state right before it first entered the position on the path of part 1.
+    """
+    count = 0
+    for position, entry_state in candidates:
+        map.add_obstacle(position)
+        map.current_position, map.current_direction = divmod(entry_state, DIRECTIONS)
+        if does_it_loop(map):
+            count += 1
+        map.remove_obstacle(position)
+    return count
 
 def solve_part_2(map: Map) -> int:
-    possible_obstacles_positions = map.former_positions
+    """
+    Count the positions on the path of part 1 where an obstacle makes the guard loop.
+    """
+    count = count_loops(map, zip(map.path, map.entry_states))
+    map.reset()
+    return count
 
-    count = 0
+_worker_map = None
+
+def _init_worker(name: str, width: int, height: int):
+    global _worker_map
+    size = width * height
+    shared_block = SharedMemory(name=name)
+    try:
+        cells = bytearray(shared_block.buf[:size])
+        stops = []
+        for offset in range(size, size + DIRECTIONS * size * STOP_SIZE, size * STOP_SIZE):
+            table = array("q")
+            table.frombytes(shared_block.buf[offset:offset + size * STOP_SIZE])
+            stops.append(table)
+    finally:
+        shared_block.close()
+    _worker_map = Map.from_tables(width, height, cells, stops)
+
+def _count_loops(candidates: List[Tuple[int, int]]) -> int:
+    return count_loops(_worker_map, candidates)
+
+def solve_part_2_parallel(map: Map, processes: int = None, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Same as solve_part_2, but the candidates are checked in batches by a process pool.
+
+    The grid and the table of stops are put into shared memory once, so the workers copy them
+    instead of indexing the obstacles again. They receive the candidates together with their
+    entry states.
+    """
+    size = len(map.cells)
+    shared_block = SharedMemory(create=True, size=size + DIRECTIONS * size * STOP_SIZE)
+    try:
+        shared_block.buf[:size] = map.cells
+        for offset, stops in zip(range(size, shared_block.size, size * STOP_SIZE), map.stops):
+            shared_block.buf[offset:offset + size * STOP_SIZE] = stops.tobytes()
+        candidates = zip(map.path, map.entry_states)
+        batches = iter(lambda: list(islice(candidates, batch_size)), [])
+        with Pool(processes, _init_worker, (shared_block.name, map.width, map.height)) as pool:
+            count = sum(pool.imap_unordered(_count_loops, batches))
+    finally:
+        shared_block.close()
+        shared_block.unlink()
     map.reset()
-    for i, position in enumerate(possible_obstacles_positions):
-        if i % 100 == 0:
-            print(f"Checking position {i}/{len(possible_obstacles_positions)}")
-        map_copy = deepcopy(map)
-        map_copy.add_obstacle(position)
-        if does_it_loop(map_copy):
-            count += 1
     return count
 
 
@@ -141,4 +342,3 @@ if __name__ == '__main__':
     map = Map(data)
     print(solve_part_1(map))
     print(solve_part_2(map))
-
@@ -0,0 +1,339 @@
+"""
+Benchmarks the hot paths of all days on seeded synthetic inputs of growing size.
+
+Inputs are generated at 1x, 10x, 100x (and on request 1000x) the size of a puzzle input.
+Every benchmark reports its fastest time over repeated calls and its peak memory, and is
+compared against a stored baseline to flag regressions.
+
+Usage: python solutions/benchmark.py [--scales 1,10,100] [--day 01] [--save-baseline] [--json]
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter_ns
+from types import ModuleType
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from runner import PHASES, SOLUTIONS_DIR, load_module
+
+SEED = 2024
+SCALES = (1, 10, 100)
+BASELINE_PATH = SOLUTIONS_DIR / "benchmark_baseline.json"
+TOLERANCE = 0.25
+REPEAT = 5
+MIN_TIME_NS = 200_000_000
+CALIBRATION_SIZE = 20_000
+# times of suspected regressions are measured again, noise rarely lasts that long
+RETRIES = 2
+
+
+def generate_day_01(rng: random.Random, scale: int) -> str:
+    """
+    Two columns of location ids, the right one partly drawn from the left one.
+    """
+    rows = 1000 * scale
+    left = [rng.randint(10000, 99999) for _ in range(rows)]
+    right = [rng.choice(left) if rng.random() < 0.3 else rng.randint(10000, 99999) for _ in range(rows)]
+    return "".join(f"{x}   {y}\n" for x, y in zip(left, right))
+
+
+def generate_day_02(rng: random.Random, scale: int) -> str:
+    """
+    Reports of mostly monotonous levels, with the occasional step that makes them unsafe.
+    """
+    rows = []
+    for _ in range(1000 * scale):
+        direction = rng.choice((-1, 1))
+        level = rng.randint(20, 80)
+        row = [level]
+        for _ in range(rng.randint(4, 7)):
+            level += direction * rng.randint(1, 3) if rng.random() < 0.9 else rng.randint(-5, 5)
+            row.append(level)
+        rows.append(" ".join(map(str, row)))
+    return "\n".join(rows) + "\n"
+
+
+def generate_day_03(rng: random.Random, scale: int) -> str:
+    """
+    Corrupted memory with valid and broken instructions in between garbage.
+    """
+    tokens = []
+    for _ in range(1000 * scale):
+        choice = rng.random()
+        if choice < 0.5:
+            tokens.append(f"mul({rng.randint(1, 999)},{rng.randint(1, 999)})")
+        elif choice < 0.55:
+            tokens.append("do()")
+        elif choice < 0.6:
+            tokens.append("don't()")
+        elif choice < 0.7:
+            tokens.append(rng.choice(("mul(4*", "mul[3,7]", "mul ( 2 , 4 )", "do_not", "mul(32,64]")))
+        tokens.append("".join(rng.choice("()[]{}<>,;:'!@#$%^&*-+=?/ xmuldo") for _ in range(rng.randint(1, 12))))
+    return "".join(tokens)
+
+
+def generate_day_04(rng: random.Random, scale: int) -> str:
+    """
+    Square grid of the letters X, M, A and S.
+    """
+    side = round(140 * math.sqrt(scale))
+    return "".join("".join(rng.choice("XMAS") for _ in range(side)) + "\n" for _ in range(side))
+
+
+def generate_day_05(rng: random.Random, scale: int) -> str:
+    """
+    Rules that order every pair of 49 pages, and updates of an odd number of those pages.
+    """
+    pages = rng.sample(range(10, 100), 49)
+    rules = [f"{pages[i]}|{pages[j]}" for i in range(len(pages)) for j in range(i + 1, len(pages))]
+    rng.shuffle(rules)
+    updates = []
+    for _ in range(200 * scale):
+        update = rng.sample(pages, rng.randrange(5, 24, 2))
+        if rng.random() < 0.5:
+            update.sort(key=pages.index)
+        updates.append(",".join(map(str, update)))
+    return "\n".join(rules) + "\n\n" + "\n".join(updates)
+
+
+def generate_day_06(rng: random.Random, scale: int) -> str:
+    """
+    Square lab with scattered obstacles, from which the guard walks out.
+    """
+    module = load_module(SOLUTIONS_DIR / "06" / "solution.py")
+    side = round(130 * math.sqrt(scale))
+    while True:
+        rows = [["#" if rng.random() < 0.012 else "." for _ in range(side)] for _ in range(side)]
+        rows[side * 3 // 4][side // 2] = "^"
+        if not module.does_it_loop(module.Map(rows)):
+            return "".join("".join(row) + "\n" for row in rows)
+
+
+GENERATORS: Dict[str, Callable[[random.Random, int], str]] = {
+    "01": generate_day_01,
+    "02": generate_day_02,
+    "03": generate_day_03,
+    "04": generate_day_04,
+    "05": generate_day_05,
+    "06": generate_day_06,
+}
+
+
+def generate_input(day: str, scale: int, directory: Path) -> str:
+    """
+    Write the input of a day at a scale to directory, unless it is already there.
+    """
+    path = directory / f"day_{day}_x{scale}.txt"
+    if not path.exists():
+        rng = random.Random(f"{SEED}-{day}-{scale}")
+        path.write_text(GENERATORS[day](rng, scale))
+    return str(path)
+
+
+class Benchmark(NamedTuple):
+    name: str
+    module: str
+    # gets the module and the input path, returns the call to time, set up from scratch
+    setup: Callable[[ModuleType, str], Callable[[], Any]]
+
+
+def _on_data(read: Callable[[ModuleType, str], Any], call: Callable[[ModuleType, Any], Any]) -> Callable[[ModuleType, str], Callable[[], Any]]:
+    """
+    Set up a benchmark of call on the data as read by the read phase of the runner.
+    """
+    def setup(module: ModuleType, path: str) -> Callable[[], Any]:
+        data = read(module, path)
+        return lambda: call(module, data)
+    return setup
+
+
+def _read_raw(module: ModuleType, path: str) -> Any:
+    return module.read_data(path)
+
+
+def _read_data(module: ModuleType, path: str) -> Callable[[], Any]:
+    return lambda: module.read_data(path)
+
+
+def _reorder_updates(module: ModuleType, path: str) -> Callable[[], Any]:
+    rules, updates = PHASES["05/solution.py"].read_data(module, path)
+    invalid = [update for update in updates if not rules.check_list(update)]
+    return lambda: [module.reorder_update(rules, list(update)) for update in invalid]
+
+
+def _does_it_loop(module: ModuleType, path: str) -> Callable[[], Any]:
+    map = PHASES["06/solution.py"].read_data(module, path)
+    module.solve_part_1(map)
+    candidates = list(zip(map.path, map.entry_states))
+    return lambda: module.count_loops(map, candidates)
+
+
+BENCHMARKS: List[Benchmark] = [
+    Benchmark("read_data", "01/clean_solution.py", _read_data),
+    Benchmark("sum_of_differences", "01/clean_solution.py", _on_data(_read_raw, lambda module, data: module.sum_of_differences(*data))),
+    Benchmark("calculate_similarity_score", "01/clean_solution.py", _on_data(_read_raw, lambda module, data: module.calculate_similarity_score(*data))),
+    Benchmark("read_data", "02/clean_solution.py", _read_data),
+    Benchmark("solve_part1", "02/clean_solution.py", _on_data(_read_raw, lambda module, data: module.solve_part1(data))),
+    Benchmark("solve_part2", "02/clean_solution.py", _on_data(_read_raw, lambda module, data: module.solve_part2(data))),
+    Benchmark("calculate_result_part2", "03/solution.py", _on_data(_read_raw, lambda module, data: module.calculate_result_part2(data))),
+    Benchmark("calculate_results_streaming", "03/solution.py", lambda module, path: lambda: module.calculate_results_streaming(path)),
+    # a fresh grid for every search, the masks it caches are part of the work
+    Benchmark("WordSearch.search", "04/solution.py", _on_data(_read_raw, lambda module, data: module.WordSearch(module.WordGrid(data)).search())),
+    Benchmark("MasSearch.search", "04/solution.py", _on_data(_read_raw, lambda module, data: module.MasSearch(module.WordGrid(data)).search())),
+    Benchmark("solve_part_1", "05/solution.py", _on_data(PHASES["05/solution.py"].read_data, lambda module, data: module.solve_part_1(*data))),
+    Benchmark("reorder_update", "05/solution.py", _reorder_updates),
+    Benchmark("solve_part_1", "06/solution.py", _on_data(PHASES["06/solution.py"].read_data, lambda module, map: module.solve_part_1(map))),
+    Benchmark("does_it_loop", "06/solution.py", _does_it_loop),
+]
+
+
+def calibrate():
+    """
+    Fixed workload timed next to every benchmark call, to tell a slower machine from slower code.
+    """
+    sorted(str(i) for i in range(CALIBRATION_SIZE))
+
+
+def _time_call(call: Callable[[], Any]) -> int:
+    start = perf_counter_ns()
+    call()
+    return perf_counter_ns() - start
+
+
+def time_calls(benchmark: Benchmark, module: ModuleType, path: str, repeat: int, min_time_ns: int) -> Tuple[int, int, int]:
+    """
+    Time a benchmark repeatedly, every call on a fresh setup, with the garbage collector off.
+
+    The call is repeated at least repeat times and until min_time_ns were spent in it, each
+    time right after the calibration workload.
+
+    :return: fastest time of a call, fastest time of the calibration and the number of calls
+    """
+    times = []
+    calibrations = []
+    while len(times) < repeat or sum(times) < min_time_ns:
+        call = benchmark.setup(module, path)
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            calibrations.append(_time_call(calibrate))
+            times.append(_time_call(call))
+        finally:
+            if gc_enabled:
+                gc.enable()
+    return min(times), min(calibrations), len(times)
+
+
+def measure(benchmark: Benchmark, module: ModuleType, path: str, repeat: int = REPEAT, min_time_ns: int = MIN_TIME_NS) -> Dict[str, int]:
+    """
+    Time a benchmark and measure its peak memory in a separate run, each on a fresh setup.
+
+    The fastest of the repeated calls is reported, it is the least disturbed by noise.
+    """
+    time, calibration, calls = time_calls(benchmark, module, path, repeat, min_time_ns)
+
+    call = benchmark.setup(module, path)
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time_ns": time, "calibration_ns": calibration, "calls": calls, "peak_bytes": peak}
+
+
+def find_regressions(result: Dict[str, Any], baseline: Dict[str, Dict[str, int]], tolerance: float) -> List[str]:
+    """
+    Compare a result against its baseline, times relative to the calibration measured with them.
+    """
+    reference = baseline.get(result["key"])
+    if reference is None:
+        return []
+    regressions = []
+    if result["time_ns"] / result["calibration_ns"] > reference["time_ns"] / reference["calibration_ns"] * (1 + tolerance):
+        regressions.append("time_ns")
+    if result["peak_bytes"] > reference["peak_bytes"] * (1 + tolerance):
+        regressions.append("peak_bytes")
+    return regressions
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    line = f"{result['key']:<50} {result['time_ns'] / 1e6:>12.3f} ms {result['peak_bytes'] / 1024:>12.1f} KiB"
+    if result["regressions"]:
+        line += "  REGRESSION: " + ", ".join(result["regressions"])
+    return line
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default=",".join(map(str, SCALES)), help="comma separated input scales, e.g. 1,10,100,1000")
+    parser.add_argument("--day", action="append", help="day to benchmark, e.g. 01, can be repeated")
+    parser.add_argument("--data-dir", help="directory for the generated inputs, defaults to a temporary directory")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="minimum number of timed calls per benchmark")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown before flagging a regression")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def run(args: argparse.Namespace, directory: Path) -> List[Dict[str, Any]]:
+    baseline = {}
+    if not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    modules = {}
+    results = []
+    for scale in map(int, args.scales.split(",")):
+        for benchmark in BENCHMARKS:
+            day = benchmark.module.split("/")[0]
+            if args.day and day not in args.day:
+                continue
+            if benchmark.module not in modules:
+                modules[benchmark.module] = load_module(SOLUTIONS_DIR / benchmark.module)
+            path = generate_input(day, scale, directory)
+            result = {"key": f"{benchmark.module}:{benchmark.name}:x{scale}"}
+            result.update(measure(benchmark, modules[benchmark.module], path, args.repeat))
+            result["regressions"] = find_regressions(result, baseline, args.tolerance)
+            for _ in range(RETRIES):
+                if "time_ns" not in result["regressions"]:
+                    break
+                result.update(measure(benchmark, modules[benchmark.module], path, args.repeat))
+                result["regressions"] = find_regressions(result, baseline, args.tolerance)
+            results.append(result)
+            if not args.json:
+                print(format_result(result), flush=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({result["key"]: {metric: result[metric] for metric in ("time_ns", "calibration_ns", "peak_bytes")} for result in results}, f, indent=2)
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, store one with --save-baseline", file=sys.stderr)
+        return 1
+    if args.data_dir:
+        directory = Path(args.data_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        results = run(args, directory)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run(args, Path(directory))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 1 if any(result["regressions"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
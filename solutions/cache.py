@@ -0,0 +1,174 @@
+"""
+On-disk cache of parsed inputs, so repeated runs on the same input skip parsing.
+
+Entries are keyed by a hash of the input file together with a hash of the source of the module
+that parses it, and stored pickled. The least recently used entries are evicted once the
+cache grows beyond its size cap.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Sequence, Tuple
+
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "advent-2024"
+MAX_SIZE = 256 << 20
+HASH_BLOCK_SIZE = 1 << 20
+SUFFIX = ".pickle"
+
+
+def hash_file(path: str) -> str:
+    """
+    Hash the content of a file, reading it in blocks.
+
+    :param path: path to the file
+    :return: hex digest of the content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParsedInputCache:
+    """
+    Directory of pickled parse results, evicted least recently used first beyond max_size bytes.
+
+    The modification time of an entry is its last use.
+    """
+    def __init__(self, directory: Path = CACHE_DIR, max_size: int = MAX_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # entries parsed with deferred=True, written by flush
+        self.pending: List[Tuple[str, Any]] = []
+
+    def key(self, path: str, name: str, sources: Iterable[str]) -> str:
+        """
+        Build the key of parsing the file at path with the parser called name.
+
+        The content of the source files of the parser is part of the key, so changing them
+        invalidates the entries parsed with them.
+        """
+        parts = [hash_file(path), name] + [hash_file(source) for source in sources]
+        return hashlib.sha256(":".join(parts).encode()).hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.directory / (key + SUFFIX)
+
+    def load(self, key: str) -> Tuple[bool, Any]:
+        """
+        Load an entry and mark it as used.
+
+        :return: True and the parsed data, or False and None if there is no readable entry
+        """
+        entry = self._entry(key)
+        try:
+            with open(entry, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            entry.unlink(missing_ok=True)
+            return False, None
+        os.utime(entry)
+        return True, data
+
+    def store(self, key: str, data: Any):
+        """
+        Store an entry, written to a temporary file first so readers never see a partial one.
+
+        The data is pickled straight into the file, entries larger than max_size are dropped.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            if size <= self.max_size:
+                os.replace(temporary, self._entry(key))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        self.evict()
+
+    def flush(self):
+        """
+        Store the entries that were parsed with deferred=True.
+        """
+        pending, self.pending = self.pending, []
+        for key, data in pending:
+            self.store(key, data)
+
+    def entries(self) -> List[Tuple[float, int, Path]]:
+        """
+        List the entries as (last use, size, path), least recently used first.
+        """
+        entries = []
+        for entry in self.directory.glob("*" + SUFFIX):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits into max_size.
+        """
+        entries = self.entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry in entries:
+            if size <= self.max_size:
+                break
+            entry.unlink(missing_ok=True)
+            size -= entry_size
+
+    def clear(self):
+        for _, _, entry in self.entries():
+            entry.unlink(missing_ok=True)
+
+    def get(
+        self, path: str, parser: Callable[[str], Any], name: str = None, sources: Sequence[str] = None, deferred: bool = False
+    ) -> Any:
+        """
+        Return parser(path), from the cache if the same input was parsed the same way before.
+
+        :param path: path to the input file
+        :param parser: function parsing the file
+        :param name: name of the parser, defaults to its qualified name
+        :param sources: source files of the parser, defaults to the file it is defined in
+        :param deferred: keep a new entry in pending until flush instead of storing it right away
+        :return: parsed data
+        """
+        if name is None:
+            name = parser.__qualname__
+        if sources is None:
+            sources = [parser.__code__.co_filename]
+        key = self.key(path, name, sources)
+        found, data = self.load(key)
+        if found:
+            self.hits += 1
+            return data
+        self.misses += 1
+        data = parser(path)
+        if deferred:
+            self.pending.append((key, data))
+        else:
+            self.store(key, data)
+        return data
+
+    def cached(self, parser: Callable[[str], Any], deferred: bool = False) -> Callable[[str], Any]:
+        """
+        Wrap a read_data function so its results go through the cache.
+        """
+        @functools.wraps(parser)
+        def read_data(path: str) -> Any:
+            return self.get(path, parser, deferred=deferred)
+        return read_data
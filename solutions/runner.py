@@ -0,0 +1,210 @@
+"""
+Runs the solutions of all days and times reading the data, part 1 and part 2 separately.
+
+Every solutions/NN/*solution.py module is discovered. Modules that only consist of a script
+are run as a whole, with their input.txt pointing to the given input file. The data built by
+the read phase is cached on disk by the hash of the input, see cache.py.
+
+Usage: python solutions/runner.py [--day 01] [--input 01=path/to/input.txt] [--json] [--no-cache]
+"""
+import argparse
+import contextlib
+import functools
+import importlib.util
+import io
+import json
+import os
+import runpy
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter_ns
+from types import ModuleType
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from cache import CACHE_DIR, ParsedInputCache
+
+SOLUTIONS_DIR = Path(__file__).resolve().parent
+
+
+class Phases(NamedTuple):
+    read_data: Callable[[ModuleType, str], Any]
+    part_1: Callable[[ModuleType, Any], Any]
+    part_2: Callable[[ModuleType, Any], Any]
+
+
+def _read_data(module: ModuleType, path: str) -> Any:
+    return module.read_data(path)
+
+
+def _read_day_04(module: ModuleType, path: str) -> Any:
+    return module.WordGrid(module.read_data(path))
+
+
+def _read_day_05(module: ModuleType, path: str) -> Any:
+    rules, updates = module.read_data(path)
+    return module.RuleSet(rules), updates
+
+
+def _read_day_06(module: ModuleType, path: str) -> Any:
+    return module.Map(module.read_data(path))
+
+
+PHASES: Dict[str, Phases] = {
+    "01/clean_solution.py": Phases(
+        _read_data,
+        lambda module, data: module.sum_of_differences(*data),
+        lambda module, data: module.calculate_similarity_score(*data),
+    ),
+    "02/clean_solution.py": Phases(
+        _read_data,
+        lambda module, data: module.solve_part1(data),
+        lambda module, data: module.solve_part2(data),
+    ),
+    "03/solution.py": Phases(
+        _read_data,
+        lambda module, data: module.calculate_result(data),
+        lambda module, data: module.calculate_result_part2(data),
+    ),
+    "04/solution.py": Phases(
+        _read_day_04,
+        lambda module, grid: module.WordSearch(grid).search(),
+        lambda module, grid: module.MasSearch(grid).search(),
+    ),
+    "05/solution.py": Phases(
+        _read_day_05,
+        lambda module, data: module.solve_part_1(*data),
+        lambda module, data: module.solve_part_2(*data),
+    ),
+    "06/solution.py": Phases(
+        _read_day_06,
+        lambda module, map: module.solve_part_1(map),
+        lambda module, map: module.solve_part_2(map),
+    ),
+}
+
+
+def discover_modules() -> List[Path]:
+    """
+    Find the solution modules of all days, sorted by day.
+    """
+    return sorted(SOLUTIONS_DIR.glob("[0-9][0-9]/*solution.py"))
+
+
+def load_module(path: Path) -> ModuleType:
+    spec = importlib.util.spec_from_file_location(f"day_{path.parent.name}_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    # registered so that instances of its classes can be pickled by the cache
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _time(function: Callable, *args) -> tuple:
+    start = perf_counter_ns()
+    result = function(*args)
+    return result, perf_counter_ns() - start
+
+
+def run_phases(path: Path, phases: Phases, input_path: str, cache: Optional[ParsedInputCache] = None) -> Dict[str, Any]:
+    module = load_module(path)
+    if cache is None:
+        data, read_time = _time(phases.read_data, module, input_path)
+    else:
+        # the structures the parts run on are cached, e.g. the grid of day 4 and the map of day 6,
+        # keyed by the source of both the module and the phase that builds them
+        name = f"{path.parent.name}/{path.name}:{phases.read_data.__name__}"
+        read = functools.partial(phases.read_data, module)
+        data, read_time = _time(cache.get, input_path, read, name, [str(path), __file__], True)
+        # stored outside of the timed phase, before the parts can change the data
+        cache.flush()
+    part_1, part_1_time = _time(phases.part_1, module, data)
+    part_2, part_2_time = _time(phases.part_2, module, data)
+    return {
+        "timings_ns": {"read_data": read_time, "part_1": part_1_time, "part_2": part_2_time},
+        "answers": {"part_1": part_1, "part_2": part_2},
+    }
+
+
+def run_script(path: Path, input_path: str) -> Dict[str, Any]:
+    """
+    Run a module that only consists of a script, in a directory where input.txt is the input file.
+    """
+    cwd = os.getcwd()
+    output = io.StringIO()
+    with tempfile.TemporaryDirectory() as directory:
+        os.symlink(os.path.abspath(input_path), os.path.join(directory, "input.txt"))
+        os.chdir(directory)
+        try:
+            with contextlib.redirect_stdout(output):
+                _, total_time = _time(runpy.run_path, str(path), None, "__main__")
+        finally:
+            os.chdir(cwd)
+    lines = output.getvalue().split()
+    return {
+        "timings_ns": {"total": total_time},
+        "answers": {f"part_{i + 1}": int(line) if line.lstrip("-").isdigit() else line for i, line in enumerate(lines)},
+    }
+
+
+def run_module(path: Path, input_path: str, cache: Optional[ParsedInputCache] = None) -> Dict[str, Any]:
+    name = f"{path.parent.name}/{path.name}"
+    phases = PHASES.get(name)
+    if phases is None:
+        result = run_script(path, input_path)
+    else:
+        result = run_phases(path, phases, input_path, cache)
+    return {"day": path.parent.name, "module": name, "input": input_path, **result}
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    lines = [f"{result['module']} ({result['input']})"]
+    for phase, time in result["timings_ns"].items():
+        answer = result["answers"].get(phase, "")
+        lines.append(f"  {phase:<10} {time / 1e6:>12.3f} ms  {answer}")
+    for part in ("part_1", "part_2"):
+        if part not in result["timings_ns"] and part in result["answers"]:
+            lines.append(f"  {part:<10} {'':>15}  {result['answers'][part]}")
+    return "\n".join(lines)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--day", action="append", help="day to run, e.g. 01, can be repeated")
+    parser.add_argument(
+        "--input",
+        action="append",
+        default=[],
+        metavar="DAY=PATH",
+        help="input file of a day, defaults to solutions/DAY/input.txt",
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the input, without the on-disk cache")
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR), help="directory of the parsed input cache")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    inputs = dict(item.split("=", 1) for item in args.input)
+    cache = None if args.no_cache else ParsedInputCache(args.cache_dir)
+    results = []
+    for path in discover_modules():
+        day = path.parent.name
+        if args.day and day not in args.day:
+            continue
+        input_path = inputs.get(day, str(path.parent / "input.txt"))
+        if not os.path.exists(input_path):
+            print(f"Skipping {day}/{path.name}, no input at {input_path}", file=sys.stderr)
+            continue
+        result = run_module(path, input_path, cache)
+        results.append(result)
+        if not args.json:
+            print(format_result(result))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())